@@ -0,0 +1,149 @@
+import os
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Redis is optional: with CACHE_ENABLED unset every lookup is a miss and
+# writes are skipped, so the API behaves exactly as without a cache.
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+INFO_CACHE_TTL = int(os.getenv('INFO_CACHE_TTL', '3600'))
+
+redis_client = Redis.from_url(REDIS_URL) if CACHE_ENABLED else None
+
+# Compare-and-delete so a holder whose lock already expired can't release someone else's
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Same check before pushing back the expiry of a lock we still own
+_EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+def digest(*parts: str) -> str:
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def cache_key(prefix: str, *parts: str) -> str:
+    """
+    Build a fixed-length key such as `info:<sha1>` from arbitrary URL parts
+    """
+    return f"{prefix}:{digest(*parts)}"
+
+async def get_json(key: str) -> Optional[dict]:
+    if redis_client is None:
+        return None
+    try:
+        value = await redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"[CACHE] Lookup failed for {key}: {e}")
+        return None
+    return orjson.loads(value) if value is not None else None
+
+async def set_json(key: str, value: dict, ttl: int):
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(key, orjson.dumps(value), ex=ttl)
+    except RedisError as e:
+        logger.warning(f"[CACHE] Write failed for {key}: {e}")
+
+async def acquire_lock(key: str, token: str, ttl: int) -> Optional[bool]:
+    """
+    Try to take a SET NX lock: True if taken, False if someone else holds it.
+    Without Redis there is nobody to coordinate with, so that counts as taken.
+    None means Redis failed and the lock state is unknown - the caller must not
+    touch anything the lock guards.
+    """
+    if redis_client is None:
+        return True
+    try:
+        return bool(await redis_client.set(key, token, nx=True, ex=ttl))
+    except RedisError as e:
+        logger.warning(f"[CACHE] Could not acquire lock {key}: {e}")
+        return None
+
+async def release_lock(key: str, token: str):
+    if redis_client is None:
+        return
+    try:
+        await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+    except RedisError as e:
+        logger.warning(f"[CACHE] Could not release lock {key}: {e}")
+
+async def extend_lock(key: str, token: str, ttl: int) -> bool:
+    if redis_client is None:
+        return True
+    try:
+        return bool(await redis_client.eval(_EXTEND_LOCK_SCRIPT, 1, key, token, ttl))
+    except RedisError as e:
+        logger.warning(f"[CACHE] Could not extend lock {key}: {e}")
+        return True
+
+@asynccontextmanager
+async def keep_lock_alive(key: str, token: Optional[str], ttl: int):
+    """
+    Refresh a held lock every ttl/3 until the block exits, so the TTL only has
+    to cover a holder that died, not the longest download. No-op without a token.
+    """
+    if redis_client is None or token is None:
+        yield
+        return
+
+    async def refresh():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            if not await extend_lock(key, token, ttl):
+                logger.warning(f"[CACHE] Lost lock {key} while holding it")
+                return
+
+    task = asyncio.create_task(refresh())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+async def lock_held(key: str) -> bool:
+    if redis_client is None:
+        return False
+    try:
+        return bool(await redis_client.exists(key))
+    except RedisError as e:
+        logger.warning(f"[CACHE] Lock check failed for {key}: {e}")
+        return False
+
+async def wait_for_json(key: str, lock_key: str, timeout: float) -> Optional[dict]:
+    """
+    Poll `key` with exponential backoff while another worker holds `lock_key`.
+    Returns None on timeout or once the lock is gone without a result.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = 0.25
+    while loop.time() < deadline:
+        value = await get_json(key)
+        if value is not None:
+            return value
+        try:
+            if not await redis_client.exists(lock_key):
+                # Holder finished (or failed) between our two reads
+                return await get_json(key)
+        except RedisError as e:
+            logger.warning(f"[CACHE] Lock check failed for {lock_key}: {e}")
+            return None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 4)
+    return None
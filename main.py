@@ -1,17 +1,48 @@
 import os
+import sys
+import glob
+import json
 import uuid
+import asyncio
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from typing import Optional
+from urllib.parse import quote
+import anyio
+import orjson
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from yt_dlp import YoutubeDL
-from models import VideoInfoRequest, VideoInfoResponse, VideoFormat
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+from models import VideoInfoRequest, VideoInfoResponse, DownloadRequest, DownloadJobResponse
+import cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# yt-dlp calls are blocking and run in anyio's worker threads; each one holds a
+# thread for the whole extraction/download, so allow more than the default 40
+YDL_THREAD_LIMIT = int(os.getenv('YDL_THREAD_LIMIT', '64'))
+
+# Worker processes serving the app on this machine. The Dockerfile and
+# `python main.py` export it for their workers; a bare `uvicorn main:app` runs one.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = YDL_THREAD_LIMIT
+    sweeper = asyncio.create_task(sweep_temp_dir_periodically())
+    yield
+    sweeper.cancel()
+    _DELETE_POOL.shutdown(wait=True)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -26,14 +57,122 @@ TEMP_DIR = os.path.join(os.path.dirname(__file__), 'temp')
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
-def cleanup_file(path: str):
+STREAM_WORKER = os.path.join(os.path.dirname(__file__), 'stream_worker.py')
+STREAM_CHUNK_SIZE = 64 * 1024
+STDERR_TAIL_SIZE = 8 * 1024
+
+# Single-flight for file downloads: the holder refreshes its per-URL lock while
+# it downloads, so the TTL only bounds how long a crashed holder blocks others.
+# Waiters give up after the same time and download privately instead.
+DOWNLOAD_LOCK_TTL = 120
+
+# Finished file downloads stay in TEMP_DIR for reuse (indexed in Redis under
+# dl-file:<sha1>) until idle for FILE_CACHE_TTL or evicted to stay in budget
+FILE_CACHE_TTL = int(os.getenv('FILE_CACHE_TTL', '3600'))
+FILE_CACHE_MAX_BYTES = int(os.getenv('FILE_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+FILE_CACHE_MAX_FILES = int(os.getenv('FILE_CACHE_MAX_FILES', '500'))
+FILE_CACHE_SWEEP_INTERVAL = 60
+
+# Queued downloads (POST /download): how many run at once per worker process.
+# They share dl-lock:<id> with GET /download and refresh it the same way.
+DOWNLOAD_JOB_CONCURRENCY = int(os.getenv('DOWNLOAD_JOB_CONCURRENCY', '4'))
+
+# Parallel fragment (DASH/HLS) and ranged-chunk fetching for downloads to a file
+# (audio and queued jobs; streamed video is fetched by ffmpeg). Clients may tune
+# these per request, but never past the caps below.
+YDL_CONCURRENT_FRAGS = int(os.getenv('YDL_CONCURRENT_FRAGS', '8'))
+YDL_HTTP_CHUNK_SIZE = int(os.getenv('YDL_HTTP_CHUNK_SIZE', str(10 * 1024 * 1024)))
+MAX_CONCURRENT_FRAGS = 16
+MIN_HTTP_CHUNK_SIZE = 1024 * 1024
+MAX_HTTP_CHUNK_SIZE = 50 * 1024 * 1024
+
+# Unlinking a multi-GB file can stall on filesystem metadata updates, so the
+# unlink itself runs on a small dedicated pool instead of the caller's thread
+_DELETE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='rm')
+
+def _unlink(path: str):
+    # No posix_fadvise(DONTNEED) first: the kernel drops a deleted inode's page
+    # cache on its own, and DONTNEED would start writeback of any still-dirty
+    # pages of a file we are about to throw away
     try:
-        if os.path.exists(path):
-            os.remove(path)
+        # The sweeper may have picked up the same .deleting file
+        with suppress(FileNotFoundError):
+            os.unlink(path)
             logger.info(f"[CLEANUP] Deleted temp file: {path}")
     except Exception as e:
         logger.error(f"[CLEANUP-ERROR] Failed to delete temp file: {e}")
 
+def cleanup_file(path: str):
+    # A missing file is the common case on error paths, so just try the rename
+    # rather than paying for an extra stat first
+    try:
+        with suppress(FileNotFoundError):
+            # The rename is cheap and frees the name right away, so a new download
+            # to the same deterministic path can't race with the pending unlink
+            deleting_path = f"{path}.{uuid.uuid4().hex}.deleting"
+            os.rename(path, deleting_path)
+            _DELETE_POOL.submit(_unlink, deleting_path)
+    except Exception as e:
+        logger.error(f"[CLEANUP-ERROR] Failed to delete temp file: {e}")
+
+def cleanup_download(base: str):
+    """
+    Delete everything a failed download left under `base` (<base>.webm, .part,
+    per-format .f137.mp4, .mp3, ...), since yt-dlp picks the extensions
+    """
+    for path in glob.glob(glob.escape(base) + '.*'):
+        cleanup_file(path)
+
+# Leftovers of an interrupted download, conversion or delete (.part/.part-FragN,
+# .ytdl, ffmpeg's .temp.<ext>, ours .deleting). Once idle for longer than a
+# download may hold its lock, nothing will finish or serve them anymore.
+_PARTIAL_MARKERS = ('.part', '.ytdl', '.temp.', '.deleting')
+
+def sweep_temp_dir():
+    """
+    Delete temp files idle for longer than FILE_CACHE_TTL (or orphaned partial
+    files idle past DOWNLOAD_LOCK_TTL), then evict the least recently used ones
+    until TEMP_DIR is back within its size and count budget.
+    Cache hits touch the file, so mtime doubles as the last-used time.
+    """
+    now = time.time()
+    entries = []
+    with os.scandir(TEMP_DIR) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            idle = now - stat.st_mtime
+            if idle > FILE_CACHE_TTL or (idle > DOWNLOAD_LOCK_TTL and any(m in entry.name for m in _PARTIAL_MARKERS)):
+                cleanup_file(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    entries.sort()
+    total_size = sum(size for _, size, _ in entries)
+    file_count = len(entries)
+    for mtime, size, path in entries:
+        if total_size <= FILE_CACHE_MAX_BYTES and file_count <= FILE_CACHE_MAX_FILES:
+            break
+        if now - mtime < DOWNLOAD_LOCK_TTL:
+            # Oldest-first, so everything from here on may still be downloading
+            break
+        cleanup_file(path)
+        total_size -= size
+        file_count -= 1
+
+async def sweep_temp_dir_periodically():
+    # Sweep once right away so orphans from a previous run are reconciled at startup
+    while True:
+        try:
+            await run_in_threadpool(sweep_temp_dir)
+        except Exception as e:
+            logger.error(f"[CLEANUP-ERROR] Temp dir sweep failed: {e}")
+        await asyncio.sleep(FILE_CACHE_SWEEP_INTERVAL)
+
 def get_ydl_opts(extra_opts=None):
     """
     Get yt-dlp options with cookie authentication support
@@ -86,6 +225,228 @@ def get_ydl_opts(extra_opts=None):
         opts.update(extra_opts)
     return opts
 
+# Process-wide YoutubeDL instances used for extraction, one per options variant.
+# Building one registers every extractor and loads cookies, so it's done once
+# per key instead of per request.
+_YDL_POOL = {}
+_YDL_POOL_LOCK = threading.Lock()
+_YDL_POOL_MAX = 32
+
+def get_ydl(key, extra_opts=None) -> YoutubeDL:
+    """
+    Get the shared YoutubeDL for `key`, creating it on first use.
+    Only use it for extract_info: options that vary per request (outtmpl,
+    fetch tuning) must not go into a shared instance.
+    """
+    ydl = _YDL_POOL.get(key)
+    if ydl is None:
+        with _YDL_POOL_LOCK:
+            ydl = _YDL_POOL.get(key)
+            if ydl is None:
+                # YoutubeDL normalizes its params dict in place, hence the copy
+                ydl = YoutubeDL(dict(get_ydl_opts(extra_opts)))
+                # Keys come from a fixed set of format selectors; the cap is just a backstop
+                if len(_YDL_POOL) < _YDL_POOL_MAX:
+                    _YDL_POOL[key] = ydl
+    return ydl
+
+def extract_info(key, url: str, extra_opts=None) -> dict:
+    """
+    Blocking metadata extraction with a shared YoutubeDL - call through run_in_threadpool
+    """
+    return get_ydl(key, extra_opts).extract_info(url, download=False)
+
+# Audio qualities and the codec FFmpegExtractAudio converts to. 'best' keeps the
+# source AAC/Opus stream as-is (only the container changes), so no re-encode.
+AUDIO_CODECS = {'audio': 'mp3', 'audio_original': 'best'}
+
+# MP3 encoding is the only CPU-heavy step left on the server. ffmpeg already runs
+# in its own process, so cap how many run at once (one thread each) instead of
+# letting a burst of audio requests oversubscribe the CPU. The cap is per worker
+# process, so by default the cores are split between the workers.
+TRANSCODE_CONCURRENCY = int(os.getenv(
+    'TRANSCODE_CONCURRENCY', str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+_TRANSCODE_SLOTS = threading.BoundedSemaphore(TRANSCODE_CONCURRENCY)
+
+class BoundedExtractAudioPP(FFmpegExtractAudioPP):
+    @classmethod
+    def pp_key(cls):
+        # Keep honouring postprocessor_args given for ExtractAudio
+        return 'ExtractAudio'
+
+    def run_ffmpeg(self, path, out_path, codec, more_opts):
+        if codec == 'copy':
+            return super().run_ffmpeg(path, out_path, codec, more_opts)
+        with _TRANSCODE_SLOTS:
+            return super().run_ffmpeg(path, out_path, codec, ['-threads', '1', *more_opts])
+
+def download_file(url: str, ydl_opts: dict, quality=None) -> dict:
+    """
+    Blocking download to ydl_opts['outtmpl'] - call through run_in_threadpool
+    """
+    with YoutubeDL(ydl_opts) as ydl:
+        if quality in AUDIO_CODECS:
+            ydl.add_post_processor(BoundedExtractAudioPP(
+                ydl, preferredcodec=AUDIO_CODECS[quality], preferredquality='192'))
+        return ydl.extract_info(url, download=True)
+
+# Every supported quality and its yt-dlp format selector, built once at import.
+# Anything else is rejected, so request input never reaches the selector parser.
+_FORMAT_STRINGS = {
+    q: f'bestvideo[height<={q[:-1]}]+bestaudio/bestvideo+bestaudio/best'
+    for q in ('144p', '240p', '360p', '480p', '720p', '1080p', '1440p', '2160p')
+}
+_FORMAT_STRINGS.update(dict.fromkeys(AUDIO_CODECS, 'bestaudio/best'))
+_FORMAT_STRINGS[None] = 'bestvideo+bestaudio/best'
+
+def get_format_string(quality):
+    """
+    Format selector for `quality`, or None if the quality isn't supported
+    """
+    return _FORMAT_STRINGS.get(quality or None)
+
+def check_quality(quality):
+    if get_format_string(quality) is None:
+        supported = ', '.join(q for q in _FORMAT_STRINGS if q)
+        raise HTTPException(status_code=400, detail=f"Unsupported quality '{quality}'. Use one of: {supported}.")
+
+def file_download_opts(quality, outtmpl: str, fetch_opts: dict) -> dict:
+    """
+    yt-dlp options for downloading `quality` into a file. Audio extraction is
+    added by download_file, which needs the YoutubeDL instance.
+    """
+    opts = {
+        'format': get_format_string(quality),
+        'outtmpl': outtmpl,
+        # Keep mtime at download time rather than the server's Last-Modified,
+        # the temp dir sweeper relies on it
+        'updatetime': False,
+        'noprogress': True,
+        **fetch_opts,
+    }
+    if quality not in AUDIO_CODECS:
+        opts['merge_output_format'] = 'mp4'
+    return opts
+
+def download_job_file(job_id: str, url: str, quality) -> dict:
+    """
+    Blocking download of a queued job to TEMP_DIR/<job_id>.<ext> - call through run_in_threadpool
+    """
+    fetch_opts = {
+        'concurrent_fragment_downloads': YDL_CONCURRENT_FRAGS,
+        'http_chunk_size': YDL_HTTP_CHUNK_SIZE,
+    }
+    outtmpl = os.path.join(TEMP_DIR, f"{job_id}.%(ext)s")
+    info = download_file(url, get_ydl_opts(file_download_opts(quality, outtmpl, fetch_opts)), quality)
+    # Final path after merging/conversion
+    path = info['requested_downloads'][0]['filepath']
+    title = safe_title(info)
+    return {'path': path, 'filename': f"{title}{os.path.splitext(path)[1]}"}
+
+def friendly_error(e: Exception) -> str:
+    """
+    Provide helpful error message for cookie-related issues
+    """
+    error_msg = str(e)
+    if "Sign in to confirm you're not a bot" in error_msg or "bot" in error_msg.lower():
+        error_msg = (
+            "YouTube requires authentication. Please configure cookies:\n"
+            "1. Set COOKIE_BROWSER=chrome (or firefox, edge, etc.) to use browser cookies, OR\n"
+            "2. Set YOUTUBE_COOKIES_PATH=/path/to/cookies.txt to use a cookie file.\n"
+            f"Original error: {error_msg}"
+        )
+    return error_msg
+
+class MediaFileResponse(FileResponse):
+    """
+    FileResponse that reads in 1 MiB chunks instead of 64 KiB.
+    Neither uvicorn nor starlette implement the ASGI zero-copy send extension,
+    so each chunk costs a threadpool read plus a send from Python; bigger
+    chunks cut that per-chunk overhead 16x for multi-hundred-MB media.
+    """
+    chunk_size = 1024 * 1024
+
+# Characters not allowed (or troublesome) in download filenames across platforms
+_SANITIZE = str.maketrans({c: '_' for c in '/\\:*?"<>|\n\r\t'})
+
+def safe_title(info) -> str:
+    return ((info or {}).get('title') or 'media').translate(_SANITIZE)
+
+def content_disposition(filename: str) -> str:
+    """
+    Build an attachment Content-Disposition header (same rules as FileResponse)
+    """
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+async def stream_media(info: dict, ydl_opts: dict):
+    """
+    Download an extracted video through stream_worker.py and return an async
+    iterator over its stdout, so bytes reach the client as yt-dlp produces them.
+
+    The first chunk is read before returning: if yt-dlp fails up front we can
+    still raise and answer with a proper error instead of an empty 200.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, STREAM_WORKER, json.dumps(ydl_opts),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Drain stderr for the whole run: if nobody reads it, a chatty child fills
+    # the pipe and blocks mid-stream. Only the tail is kept, for error reports.
+    async def read_stderr() -> str:
+        tail = b''
+        while chunk := await proc.stderr.read(STREAM_CHUNK_SIZE):
+            tail = (tail + chunk)[-STDERR_TAIL_SIZE:]
+        return tail.decode(errors='replace').strip()
+    stderr_task = asyncio.create_task(read_stderr())
+
+    proc.stdin.write(orjson.dumps(YoutubeDL.sanitize_info(info)))
+    await proc.stdin.drain()
+    proc.stdin.close()
+
+    first_chunk = await proc.stdout.read(STREAM_CHUNK_SIZE)
+    if not first_chunk:
+        await proc.wait()
+        stderr = await stderr_task
+        raise RuntimeError(stderr or f"yt-dlp exited with status {proc.returncode}")
+
+    async def body():
+        try:
+            yield first_chunk
+            while chunk := await proc.stdout.read(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            # Client went away or stream finished - make sure yt-dlp/ffmpeg don't linger
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            stderr = await stderr_task
+            if proc.returncode not in (0, -9):
+                logger.error(f"[STREAM-ERROR] yt-dlp exited with status {proc.returncode} for: {info.get('webpage_url')}: {stderr}")
+
+    return body()
+
+async def serve_pooled_file(file_key: str, pooled: dict) -> Optional[MediaFileResponse]:
+    """
+    Serve a reused download and push back its expiry, both in Redis and for the sweeper.
+    Returns None if the file is gone (a sweeper in any worker may have just
+    removed it) - callers treat that as a cache miss.
+    """
+    try:
+        os.utime(pooled['path'])
+    except FileNotFoundError:
+        return None
+    await cache.set_json(file_key, pooled, FILE_CACHE_TTL)
+    return MediaFileResponse(
+        path=pooled['path'],
+        filename=pooled['filename'],
+        media_type='application/octet-stream'
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -102,101 +463,173 @@ async def health_check():
         "status": "healthy",
         "service": "YouTube Downloader",
         "cookie_auth": cookie_method,
+        "cache_enabled": cache.CACHE_ENABLED,
         "temp_dir": TEMP_DIR
     }
 
-@app.post("/info", response_model=VideoInfoResponse)
+# The body is built by us from yt-dlp's output, so it isn't re-validated against
+# VideoInfoResponse; the model only documents the response in the OpenAPI schema
+@app.post("/info", responses={200: {"model": VideoInfoResponse}})
 async def get_info(request: VideoInfoRequest):
     url = request.url
     if not url:
         raise HTTPException(status_code=400, detail="No URL provided.")
     
     logger.info(f"[INFO] Received info request for URL: {url}")
+    cache_key = cache.cache_key('info', url)
+    cached = await cache.get_json(cache_key)
+    if cached is not None:
+        logger.info(f"[INFO] Cache hit for URL: {url}")
+        return ORJSONResponse(cached)
+    
     try:
-        with YoutubeDL(get_ydl_opts()) as ydl:
-            metadata = ydl.extract_info(url, download=False)
-        
-        formats = metadata.get('formats', [])
-        video_formats = [
-            VideoFormat(
-                format_id=f.get('format_id'),
-                ext=f.get('ext'),
-                resolution=f.get('resolution'),
-                note=f.get('format_note'),
-                filesize=f.get('filesize'),
-            )
-            for f in formats if f.get('resolution') or (f.get('format_note') and f.get('format_note', '').startswith('audio only'))
-        ]
+        metadata = await run_in_threadpool(extract_info, 'info', url)
+        
+        # Hot loop over 40+ formats: bind lookups to locals and read each field once
+        video_formats = []
+        append = video_formats.append
+        for f in metadata.get('formats') or ():
+            get = f.get
+            resolution = get('resolution')
+            note = get('format_note')
+            if resolution or (note and note[:10] == 'audio only'):
+                append({
+                    'format_id': get('format_id'),
+                    'ext': get('ext'),
+                    'resolution': resolution,
+                    'note': note,
+                    'filesize': get('filesize'),
+                })
         
         logger.info(f"[INFO] Successfully fetched info for: {metadata.get('title')}")
-        return VideoInfoResponse(
-            title=metadata.get('title'),
-            thumbnail=metadata.get('thumbnail'),
-            formats=video_formats
-        )
+        response_data = {
+            'title': metadata.get('title'),
+            'thumbnail': metadata.get('thumbnail'),
+            'formats': video_formats,
+        }
+        await cache.set_json(cache_key, response_data, cache.INFO_CACHE_TTL)
+        # Returned as a response object so FastAPI skips jsonable_encoder too
+        return ORJSONResponse(response_data)
     except Exception as e:
         logger.error(f"[ERROR] Failed to fetch info for URL: {url} - {str(e)}")
-        
-        # Provide helpful error message for cookie-related issues
-        error_msg = str(e)
-        if "Sign in to confirm you're not a bot" in error_msg or "bot" in error_msg.lower():
-            error_msg = (
-                "YouTube requires authentication. Please configure cookies:\n"
-                "1. Set COOKIE_BROWSER=chrome (or firefox, edge, etc.) to use browser cookies, OR\n"
-                "2. Set YOUTUBE_COOKIES_PATH=/path/to/cookies.txt to use a cookie file.\n"
-                f"Original error: {error_msg}"
-            )
-        
-        raise HTTPException(status_code=500, detail=f"Failed to fetch video information: {error_msg}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch video information: {friendly_error(e)}")
 
 @app.get("/download")
 async def download_video(
     background_tasks: BackgroundTasks,
     url: str = Query(..., description="Video URL"),
-    quality: str = Query(None, description="Video quality (e.g., 1080p, audio)")
+    quality: str = Query(None, description="Video quality (e.g., 1080p, audio, audio_original)"),
+    concurrent_fragments: int = Query(
+        None, ge=1, le=MAX_CONCURRENT_FRAGS,
+        description="Number of DASH/HLS fragments fetched in parallel (audio only)"
+    ),
+    http_chunk_size: int = Query(
+        None, ge=MIN_HTTP_CHUNK_SIZE, le=MAX_HTTP_CHUNK_SIZE,
+        description="Size in bytes of the ranged requests used for non-fragmented formats (audio only)"
+    )
 ):
     if not url:
         raise HTTPException(status_code=400, detail="No URL provided.")
+    check_quality(quality)
     
     temp_filename = f"{uuid.uuid4()}.mp4"
     temp_filepath = os.path.join(TEMP_DIR, temp_filename)
     logger.info(f"[DOWNLOAD] Starting download for URL: {url} with quality: {quality}")
     
     try:
-        if quality == 'audio':
-            format_string = 'bestaudio/best'
-        elif quality:
-            height = quality.replace('p', '')
-            format_string = f'bestvideo[height<={height}]+bestaudio/bestvideo+bestaudio/best'
-        else:
-            format_string = 'bestvideo+bestaudio/best'
-            
-        extra_opts = {
-            'format': format_string,
-            'outtmpl': temp_filepath,
-            'merge_output_format': 'mp4',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }] if quality == 'audio' else [],
+        format_string = get_format_string(quality)
+        
+        fetch_opts = {
+            'concurrent_fragment_downloads': concurrent_fragments or YDL_CONCURRENT_FRAGS,
+            'http_chunk_size': http_chunk_size or YDL_HTTP_CHUNK_SIZE,
         }
         
-        ydl_opts = get_ydl_opts(extra_opts)
+        # A finished file for the same url+quality (from an earlier audio request
+        # or a queued download) is served from disk instead of downloading again
+        digest = cache.digest(url, quality or '')
+        lock_key = f"dl-lock:{digest}"
+        file_key = f"dl-file:{digest}"
+        
+        pooled = await cache.get_json(file_key)
+        if pooled and (response := await serve_pooled_file(file_key, pooled)):
+            logger.info(f"[DOWNLOAD] Serving cached file: {pooled['path']}")
+            return response
+        
+        if quality not in AUDIO_CODECS:
+            # Video is streamed: ffmpeg muxes into fragmented MP4 on stdout, which
+            # (unlike a regular MP4) doesn't need a seekable file to be finalized
+            stream_opts = {
+                'format': format_string,
+                'outtmpl': '-',
+                'merge_output_format': 'mp4',
+                'external_downloader_args': {
+                    'ffmpeg_o': ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov'],
+                },
+            }
+            info = await run_in_threadpool(extract_info, ('stream', format_string), url, stream_opts)
+            # No fetch_opts here: merged formats written to stdout go through
+            # ffmpeg, which does its own fetching and ignores both settings
+            ydl_opts = get_ydl_opts(stream_opts)
+            
+            title = safe_title(info)
+            body = await stream_media(info, ydl_opts)
+            logger.info(f"[DOWNLOAD] Streaming started for: {info.get('title')}")
+            
+            return StreamingResponse(
+                body,
+                media_type='video/mp4',
+                headers={'Content-Disposition': content_disposition(f"{title}.mp4")}
+            )
+        
+        # Audio still goes through a temp file: FFmpegExtractAudio runs after the download.
+        # With Redis the finished file is kept under a deterministic name and reused:
+        # identical concurrent requests wait for the one holding the lock, and later
+        # ones are served from disk until the file expires.
+        lock_token = uuid.uuid4().hex
+        
+        acquired = await cache.acquire_lock(lock_key, lock_token, DOWNLOAD_LOCK_TTL)
+        if acquired is False:
+            logger.info(f"[DOWNLOAD] Waiting for in-flight download of: {url}")
+            pooled = await cache.wait_for_json(file_key, lock_key, DOWNLOAD_LOCK_TTL)
+            if pooled and (response := await serve_pooled_file(file_key, pooled)):
+                logger.info(f"[DOWNLOAD] Serving shared file: {pooled['path']}")
+                return response
+            # Holder failed or timed out - download privately under the random name
+            lock_token = None
+        elif acquired is None or cache.redis_client is None:
+            # Redis is off or failing, so other requests may be downloading the
+            # same URL right now - use the random name instead of the shared one
+            lock_token = None
+        else:
+            temp_filepath = os.path.join(TEMP_DIR, f"{digest}.mp4")
         
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            if quality == 'audio':
-                temp_filepath = temp_filepath.replace('.mp4', '.mp3')
-                
-        logger.info(f"[DOWNLOAD] File saved to temp path: {temp_filepath}")
+        # The extension is only known after extraction (.mp3, or .m4a/.opus when kept as-is)
+        outtmpl = os.path.splitext(temp_filepath)[0] + '.%(ext)s'
+        extra_opts = file_download_opts(quality, outtmpl, fetch_opts)
         
-        title = info.get('title', 'media').replace('/', '_').replace('\\', '_')
-        final_filename = f"{title}.mp3" if quality == 'audio' else f"{title}.mp4"
+        ydl_opts = get_ydl_opts(extra_opts)
         
-        background_tasks.add_task(cleanup_file, temp_filepath)
+        try:
+            async with cache.keep_lock_alive(lock_key, lock_token, DOWNLOAD_LOCK_TTL):
+                info = await run_in_threadpool(download_file, url, ydl_opts, quality)
+            temp_filepath = info['requested_downloads'][0]['filepath']
+            
+            logger.info(f"[DOWNLOAD] File saved to temp path: {temp_filepath}")
+            
+            title = safe_title(info)
+            final_filename = f"{title}{os.path.splitext(temp_filepath)[1]}"
+            
+            if lock_token:
+                await cache.set_json(file_key, {'path': temp_filepath, 'filename': final_filename}, FILE_CACHE_TTL)
+        finally:
+            if lock_token:
+                await cache.release_lock(lock_key, lock_token)
+        
+        if not lock_token:
+            # Not indexed for reuse, so nobody else will ever ask for it
+            background_tasks.add_task(cleanup_file, temp_filepath)
         
-        return FileResponse(
+        return MediaFileResponse(
             path=temp_filepath,
             filename=final_filename,
             media_type='application/octet-stream'
@@ -206,24 +639,137 @@ async def download_video(
         logger.error(f"[DOWNLOAD-ERROR] Execution failed for {url}: {str(e)}")
         
         # Cleanup on error
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
-        mp3_path = temp_filepath.replace('.mp4', '.mp3')
-        if os.path.exists(mp3_path):
-            os.remove(mp3_path)
-        
-        # Provide helpful error message for cookie-related issues
-        error_msg = str(e)
-        if "Sign in to confirm you're not a bot" in error_msg or "bot" in error_msg.lower():
-            error_msg = (
-                "YouTube requires authentication. Please configure cookies:\n"
-                "1. Set COOKIE_BROWSER=chrome (or firefox, edge, etc.) to use browser cookies, OR\n"
-                "2. Set YOUTUBE_COOKIES_PATH=/path/to/cookies.txt to use a cookie file.\n"
-                f"Original error: {error_msg}"
-            )
-            
-        raise HTTPException(status_code=500, detail=f"Failed to process the video: {error_msg}")
+        cleanup_download(os.path.splitext(temp_filepath)[0])
+        
+        raise HTTPException(status_code=500, detail=f"Failed to process the video: {friendly_error(e)}")
+
+# Job records live in Redis so any worker can answer a poll; without Redis they
+# fall back to this process, so queued downloads are refused with several workers
+_LOCAL_JOBS = {}
+_JOB_SLOTS = asyncio.Semaphore(DOWNLOAD_JOB_CONCURRENCY)
+_JOB_TASKS = set()
+
+async def save_job(job_id: str, job: dict):
+    if cache.redis_client is None:
+        now = time.time()
+        for stale_id in [k for k, (expires_at, _) in _LOCAL_JOBS.items() if expires_at < now]:
+            del _LOCAL_JOBS[stale_id]
+        _LOCAL_JOBS[job_id] = (now + FILE_CACHE_TTL, job)
+    else:
+        await cache.set_json(f"job:{job_id}", job, FILE_CACHE_TTL)
+
+async def load_job(job_id: str):
+    if cache.redis_client is None:
+        expires_at, job = _LOCAL_JOBS.get(job_id, (0, None))
+        return job if expires_at > time.time() else None
+    return await cache.get_json(f"job:{job_id}")
+
+async def run_download_job(job_id: str, url: str, quality, lock_token: str):
+    lock_key = f"dl-lock:{job_id}"
+    try:
+        # Refreshed while the job waits for a slot and while it downloads, so
+        # neither can outlast the lock; it only lapses if this worker dies
+        async with cache.keep_lock_alive(lock_key, lock_token, DOWNLOAD_LOCK_TTL):
+            async with _JOB_SLOTS:
+                logger.info(f"[JOB] Starting download {job_id} for URL: {url} with quality: {quality}")
+                pooled = await run_in_threadpool(download_job_file, job_id, url, quality)
+            await cache.set_json(f"dl-file:{job_id}", pooled, FILE_CACHE_TTL)
+            await save_job(job_id, {'status': 'ready', **pooled})
+        logger.info(f"[JOB] Download {job_id} ready at: {pooled['path']}")
+    except Exception as e:
+        logger.error(f"[JOB-ERROR] Download {job_id} failed for {url}: {str(e)}")
+        # Still holding the lock, so nobody else is writing to <job_id>.*
+        cleanup_download(os.path.join(TEMP_DIR, job_id))
+        await save_job(job_id, {'status': 'error', 'error': friendly_error(e)})
+    finally:
+        await cache.release_lock(lock_key, lock_token)
+
+async def find_job_file(job_id: str, job):
+    pooled = await cache.get_json(f"dl-file:{job_id}")
+    if pooled is None and job and job['status'] == 'ready':
+        pooled = {'path': job['path'], 'filename': job['filename']}
+    return pooled if pooled and os.path.exists(pooled['path']) else None
+
+async def job_in_progress(job_id: str, job) -> bool:
+    # With Redis the download lock is the source of truth: it also covers a
+    # GET /download producing the same file, and it lapses if a worker dies
+    if cache.redis_client is not None:
+        return await cache.lock_held(f"dl-lock:{job_id}")
+    return bool(job) and job['status'] == 'pending'
+
+@app.post("/download", status_code=202, response_model=DownloadJobResponse)
+async def enqueue_download(request: DownloadRequest):
+    """
+    Queue a download and return its job id right away; poll GET /download/{job_id}.
+    The id is derived from url+quality, so identical requests share one job.
+    """
+    url, quality = request.url, request.quality
+    if not url:
+        raise HTTPException(status_code=400, detail="No URL provided.")
+    check_quality(quality)
+    if cache.redis_client is None and WEB_CONCURRENCY > 1:
+        # A poll landing on another worker would never find the job
+        raise HTTPException(
+            status_code=503,
+            detail="Queued downloads need CACHE_ENABLED=true when running more than one worker."
+        )
+    
+    job_id = cache.digest(url, quality or '')
+    job = await load_job(job_id)
+    if await find_job_file(job_id, job):
+        return {"job_id": job_id, "status": "ready"}
+    
+    if await job_in_progress(job_id, job):
+        return {"job_id": job_id, "status": "pending"}
+    lock_token = uuid.uuid4().hex
+    acquired = await cache.acquire_lock(f"dl-lock:{job_id}", lock_token, DOWNLOAD_LOCK_TTL)
+    if acquired is None:
+        # Can't tell whether another worker already runs this job into <job_id>.*
+        raise HTTPException(status_code=503, detail="Download queue is temporarily unavailable, please try again.")
+    if not acquired:
+        return {"job_id": job_id, "status": "pending"}
+    
+    await save_job(job_id, {'status': 'pending'})
+    task = asyncio.create_task(run_download_job(job_id, url, quality, lock_token))
+    _JOB_TASKS.add(task)
+    task.add_done_callback(_JOB_TASKS.discard)
+    logger.info(f"[JOB] Queued download {job_id} for URL: {url} with quality: {quality}")
+    return {"job_id": job_id, "status": "pending"}
+
+@app.get("/download/{job_id}", responses={202: {"model": DownloadJobResponse}})
+async def get_download(job_id: str):
+    """
+    202 while the job is pending, the file once it's ready
+    """
+    job = await load_job(job_id)
+    status = job['status'] if job else None
+    
+    pooled = await find_job_file(job_id, job)
+    if pooled and (response := await serve_pooled_file(f"dl-file:{job_id}", pooled)):
+        return response
+    
+    if await job_in_progress(job_id, job):
+        return ORJSONResponse({"job_id": job_id, "status": "pending"}, status_code=202)
+    if status == 'error':
+        raise HTTPException(status_code=500, detail=f"Failed to process the video: {job['error']}")
+    if status == 'ready':
+        raise HTTPException(status_code=410, detail="The download has expired, please request it again.")
+    if status == 'pending':
+        raise HTTPException(status_code=500, detail="The download was interrupted, please request it again.")
+    raise HTTPException(status_code=404, detail="Unknown download job.")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # Extraction is partly CPU-bound (yt-dlp's JS interpreter), so run one worker
+    # per core. Workers need the app as an import string; loop/http pick
+    # uvloop and httptools when installed.
+    # Exported so each worker process sees how many siblings it has
+    os.environ.setdefault('WEB_CONCURRENCY', str(os.cpu_count() or 1))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8080,
+        workers=int(os.environ['WEB_CONCURRENCY']),
+        loop="auto",
+        http="auto",
+    )
\ No newline at end of file
@@ -15,3 +15,11 @@ class VideoInfoResponse(BaseModel):
     title: Optional[str] = None
     thumbnail: Optional[str] = None
     formats: List[VideoFormat] = []
+
+class DownloadRequest(BaseModel):
+    url: str
+    quality: Optional[str] = None
+
+class DownloadJobResponse(BaseModel):
+    job_id: str
+    status: str
@@ -0,0 +1,26 @@
+"""
+Child process used by /download to stream media straight to the client.
+
+yt-dlp can only write to the process-wide stdout when `outtmpl` is '-', so
+every streamed download runs in its own interpreter. The parent passes the
+yt-dlp options as JSON in argv[1] and the already-extracted info dict on
+stdin, and forwards whatever we write to stdout into the HTTP response.
+"""
+import json
+import sys
+
+from yt_dlp import YoutubeDL
+
+
+def main():
+    opts = json.loads(sys.argv[1])
+    opts['outtmpl'] = '-'
+    # Progress lines go to the console stream even in quiet mode and would corrupt the media
+    opts['noprogress'] = True
+    with YoutubeDL(opts) as ydl:
+        # '-' makes yt-dlp read the info JSON from stdin (same as --load-info-json -)
+        return ydl.download_with_info_file('-')
+
+
+if __name__ == "__main__":
+    sys.exit(main())